@@ -8,15 +8,73 @@ This module defines a Pipe class that utilizes N8N for an Agent
 Supports both standard JSON and streaming NDJSON responses
 Now includes polling-based status updates for async workflows
 v0.5.0: Uses message streaming for live status updates in chat
+
+All n8n traffic runs on the host's event loop. For lower per-request I/O
+overhead, install uvloop in the OpenWebUI environment; uvicorn picks it up
+automatically (--loop auto). The pipe does not install a loop policy itself.
 """
 
-from typing import Optional, Callable, Awaitable
+from typing import Optional, Callable, Awaitable, AsyncIterator, Iterator, Mapping
+from types import MappingProxyType
 from pydantic import BaseModel, Field
-import os
 import time
 import json
+import re
+import random
+import functools
+import hashlib
 import asyncio
 import aiohttp
+from collections import OrderedDict
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# Poll backoff: grow the delay while the workflow reports no progress
+_POLL_BACKOFF = 1.5
+_MAX_POLL_DELAY = 30.0
+
+# Streamed chunks are emitted once this many bytes or seconds have built up
+_COALESCE_BYTES = 512
+_COALESCE_SECONDS = 0.05
+
+# Workflow outputs keyed on (chat_id, question digest), least recently used
+# first, with whether they were streamed into the chat and when they were stored
+_RESPONSE_CACHE: "OrderedDict[tuple[str, str], tuple[str, bool, float]]" = OrderedDict()
+_RESPONSE_CACHE_SIZE = 128
+
+# Artifact paths written by every TOGAF workflow run
+_ARTIFACT_BLOCK = """**ArchiMate 3.1 Models:**
+- docs/architecture/compliance.archimate
+- docs/architecture/business-canvas.archimate
+- docs/architecture/business-architecture.archimate
+- docs/architecture/technology-recommendations.archimate
+- docs/architecture/application-architecture.archimate
+- docs/architecture/infrastructure-architecture.archimate
+- docs/architecture/implementation-plan.archimate
+
+**Documentation:**
+- docs/requirements.md
+- docs/PRD.md
+
+**Deployment:**
+- docs/deployment/application.oam.yaml
+"""
+
+# A "}" followed by a newline and "{" cannot occur in a single JSON document
+# (newlines inside strings are escaped), so it marks NDJSON event boundaries
+_NDJSON_BOUNDARY = re.compile(rb"}[ \t\r]*\n\s*{")
+_NDJSON_PROBE_BYTES = 1024
+_WHITESPACE = b" \t\r\n"
+
+# n8n streaming responses open with one of these events; any other body,
+# even one starting with {"type":, is an ordinary JSON document
+_NDJSON_FIRST_EVENT = re.compile(rb'\s*{"type":\s*"(?:begin|item|message)"')
+_NDJSON_HEAD_BYTES = 32
 
 
 def extract_event_info(event_emitter) -> tuple[Optional[str], Optional[str]]:
@@ -30,6 +88,42 @@ def extract_event_info(event_emitter) -> tuple[Optional[str], Optional[str]]:
     return None, None
 
 
+@functools.lru_cache(maxsize=32)
+def render_final_response(
+    repo: str, project: str, domain: str, artifact_count: int
+) -> str:
+    """Render the completion message, cached as the same result is often re-sent."""
+    return f"""**TOGAF Enterprise Architecture Complete**
+
+**Repository:** `{repo}`
+**Project:** {project}
+**Domain:** {domain}
+
+**Generated Artifacts ({artifact_count} files):**
+
+{_ARTIFACT_BLOCK}
+[View Repository](https://github.com/shlapolosa/{repo})
+"""
+
+
+def looks_like_ndjson(raw: bytes, start: int = 0) -> bool:
+    """Detect multi-event NDJSON from the first KiB of the body only."""
+    return (
+        _NDJSON_BOUNDARY.search(raw, start, start + _NDJSON_PROBE_BYTES) is not None
+    )
+
+
+def event_content(event_type: Optional[str], event: dict):
+    """Return the chat content carried by an NDJSON item or message event."""
+    if event_type == "item":
+        # Streaming content chunks
+        return event.get("content", "")
+    if event_type == "message":
+        # Alternative message format
+        return event.get("content", "") or event.get("data", "")
+    return ""
+
+
 class Pipe:
     class Valves(BaseModel):
         n8n_url: str = Field(
@@ -52,12 +146,23 @@ class Pipe:
         enable_status_indicator: bool = Field(
             default=True, description="Enable or disable status indicator emissions"
         )
+        n8n_stream_url: str = Field(
+            default="",
+            description="Optional NDJSON status stream URL, polling is used if unset or unavailable"
+        )
         poll_interval: float = Field(
             default=5.0, description="Interval in seconds between status polls"
         )
         max_poll_time: float = Field(
             default=600.0, description="Maximum polling duration in seconds (10 min default)"
         )
+        enable_response_cache: bool = Field(
+            default=False,
+            description="Replay the previous result when the same question is asked again in a chat"
+        )
+        response_cache_ttl: float = Field(
+            default=3600.0, description="Seconds a cached workflow result stays valid"
+        )
 
     def __init__(self):
         self.type = "pipe"
@@ -66,6 +171,77 @@ class Pipe:
         self.valves = self.Valves()
         self.last_emit_time = 0
         self.streamed_messages = []  # Track streamed status messages
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._headers: Mapping[str, str] = MappingProxyType({})
+        self._headers_token: Optional[str] = None
+        # Bounds each status poll so a stuck endpoint cannot stall the loop
+        self._poll_timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=5, sock_read=10
+        )
+
+    def _get_headers(self) -> Mapping[str, str]:
+        """Return the request headers, rebuilt only when the bearer token changes.
+
+        The headers are shared by every request, so they are exposed read-only.
+        """
+        token = self.valves.n8n_bearer_token
+        if token != self._headers_token:
+            self._headers = MappingProxyType(
+                {
+                    "Authorization": f"Bearer {token}",
+                    "Content-Type": "application/json",
+                }
+            )
+            self._headers_token = token
+        return self._headers
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared keep-alive session, creating it on first use.
+
+        The session outlives valve changes, so every request passes its own
+        timeout built from the current valves instead of a session-wide one.
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=32,
+                    limit_per_host=16,
+                    keepalive_timeout=75,
+                    ttl_dns_cache=300,
+                ),
+            )
+        return self._session
+
+    async def aclose(self):
+        """Close the shared session and its pooled connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    def _cached_response(self, key: tuple[str, str]) -> Optional[tuple[str, bool]]:
+        """Return the unexpired cached (response, streamed) for key, if any."""
+        entry = _RESPONSE_CACHE.get(key)
+        if entry is None:
+            return None
+        response, streamed, stored_at = entry
+        if time.monotonic() - stored_at > self.valves.response_cache_ttl:
+            del _RESPONSE_CACHE[key]
+            return None
+        _RESPONSE_CACHE.move_to_end(key)
+        return response, streamed
+
+    def _store_response(self, key: tuple[str, str], response: str, streamed: bool):
+        """Cache response for key, evicting the least recently used entries."""
+        _RESPONSE_CACHE[key] = (response, streamed, time.monotonic())
+        _RESPONSE_CACHE.move_to_end(key)
+        while len(_RESPONSE_CACHE) > _RESPONSE_CACHE_SIZE:
+            _RESPONSE_CACHE.popitem(last=False)
 
     async def emit_message(
         self,
@@ -88,7 +264,7 @@ class Pipe:
         message: str,
         done: bool,
     ):
-        current_time = time.time()
+        current_time = time.monotonic()
         if (
             __event_emitter__
             and self.valves.enable_status_indicator
@@ -109,84 +285,318 @@ class Pipe:
             )
             self.last_emit_time = current_time
 
-    def parse_response_text(self, response_text: str) -> tuple[str, Optional[str]]:
+    async def emit_combined(
+        self,
+        __event_emitter__: Callable[[dict], Awaitable[None]],
+        content: str,
+        level: str,
+        message: str,
+        done: bool,
+    ):
+        """Emit a chat message and its status indicator update together.
+
+        OpenWebUI only understands separate message and status events, so both
+        are issued concurrently rather than one after the other.
+        """
+        await asyncio.gather(
+            self.emit_message(__event_emitter__, content),
+            self.emit_status(__event_emitter__, level, message, done),
+        )
+
+    def parse_response_text(self, raw: bytes) -> tuple[str, Optional[str]]:
         """
         Parse n8n response handling both formats:
         1. Standard JSON: {"output": "..."} or {"executionId": "...", ...}
         2. Streaming NDJSON: {"type":"begin"...}\n{"type":"item","content":"..."}\n{"type":"end"...}
 
+        Takes the raw response body so it is parsed without a separate decode pass.
+
         Returns: (content, executionId) - executionId may be None for sync responses
         """
-        response_text = response_text.strip()
+        # Locate the non-whitespace span by index rather than copying the
+        # whole body with strip(); the JSON parsers skip the whitespace anyway
+        start, end = 0, len(raw)
+        while start < end and raw[start] in _WHITESPACE:
+            start += 1
+        while end > start and raw[end - 1] in _WHITESPACE:
+            end -= 1
         execution_id = None
+        loads = _loads
 
-        # Try standard JSON first
-        try:
-            data = json.loads(response_text)
-            # Check for executionId (polling mode)
-            if isinstance(data, dict):
-                execution_id = data.get("executionId")
-                # Standard format with configured response field
-                if self.valves.response_field in data:
-                    return data[self.valves.response_field], execution_id
-                # If executionId present, return initial message
-                if execution_id:
-                    return data.get("message", "Workflow started..."), execution_id
-            # Direct string response
-            if isinstance(data, str):
-                return data, None
-        except json.JSONDecodeError:
-            pass
+        # Try standard JSON first, unless the head of the body already shows
+        # NDJSON event boundaries (parsing it as one document scans it all)
+        if not looks_like_ndjson(raw, start):
+            # ValueError covers JSONDecodeError and invalid UTF-8 in the bytes
+            try:
+                data = loads(raw)
+                # Check for executionId (polling mode)
+                if isinstance(data, dict):
+                    execution_id = data.get("executionId")
+                    # Standard format with configured response field
+                    if self.valves.response_field in data:
+                        return data[self.valves.response_field], execution_id
+                    # If executionId present, return initial message
+                    if execution_id:
+                        return data.get("message", "Workflow started..."), execution_id
+                # Direct string response
+                if isinstance(data, str):
+                    return data, None
+            except ValueError:
+                pass
 
         # Handle NDJSON streaming format
-        if "\n" in response_text or response_text.startswith('{"type":'):
-            content_parts = []
-            for line in response_text.split("\n"):
-                line = line.strip()
-                if not line:
-                    continue
+        if raw.startswith(b'{"type":', start) or (
+            raw.find(b"\n", start, min(end, start + _NDJSON_PROBE_BYTES)) != -1
+        ):
+            # Plain-text lines go in as-is, so only one decode happens at the end
+            buf = bytearray()
+            for event_type, event in self.iter_ndjson_events(raw):
+                # Check for executionId in any event
+                if event.get("executionId"):
+                    execution_id = event.get("executionId")
+
+                content = event_content(event_type, event)
+                if content:
+                    buf.extend(
+                        content.encode() if isinstance(content, str) else content
+                    )
+
+            if buf:
+                return buf.decode("utf-8", "replace"), execution_id
+
+        # Fallback: return raw text, decoding only the trimmed span
+        return str(memoryview(raw)[start:end], "utf-8", "replace"), execution_id
+
+    def iter_ndjson_events(self, raw: bytes) -> Iterator[tuple[Optional[str], dict]]:
+        """Lazily yield (event_type, event) for each NDJSON line in raw.
+
+        Lines that are not JSON are yielded as item events carrying the raw bytes.
+        """
+        loads = _loads
+        for line in raw.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                event = loads(line)
+            except ValueError:
+                # Not JSON, might be plain text chunk
+                yield "item", {"type": "item", "content": line}
+                continue
+            if isinstance(event, dict):
+                yield event.get("type"), event
+
+    async def _iter_ndjson(
+        self,
+        response: aiohttp.ClientResponse,
+        head: bytes = b"",
+        read_timeout: Optional[Callable[[], Optional[float]]] = None,
+    ) -> AsyncIterator[tuple[Optional[str], Optional[dict]]]:
+        """Yield (event_type, event) from the response body as each line arrives.
+
+        Lines are split from raw chunks rather than read with readline(), which
+        aiohttp caps at 512 KiB per line. If given, read_timeout is called before
+        each read and returns how long to wait for data (None waits as long as
+        it takes); when that wait runs out (None, None) is yielded instead.
+        """
+        readany = response.content.readany
+        buf = bytearray(head)
+        while True:
+            # Parse every complete line, keep the partial tail for the next chunk
+            end = buf.rfind(b"\n")
+            if end != -1:
+                for item in self.iter_ndjson_events(buf[:end]):
+                    yield item
+                del buf[: end + 1]
+            timeout = read_timeout() if read_timeout else None
+            if timeout is None:
+                chunk = await readany()
+            else:
+                # readany() only consumes data once it returns, so cancelling
+                # it on timeout loses nothing
                 try:
-                    event = json.loads(line)
-                    event_type = event.get("type")
-
-                    # Check for executionId in any event
-                    if event.get("executionId"):
-                        execution_id = event.get("executionId")
-
-                    if event_type == "item":
-                        # Streaming content chunks
-                        content = event.get("content", "")
-                        if content:
-                            content_parts.append(content)
-                    elif event_type == "message":
-                        # Alternative message format
-                        content = event.get("content", "") or event.get("data", "")
-                        if content:
-                            content_parts.append(content)
-                except json.JSONDecodeError:
-                    # Not JSON, might be plain text chunk
-                    content_parts.append(line)
-
-            if content_parts:
-                return "".join(content_parts), execution_id
-
-        # Fallback: return raw text
-        return response_text, execution_id
+                    chunk = await asyncio.wait_for(readany(), timeout)
+                except asyncio.TimeoutError:
+                    yield None, None
+                    continue
+            if not chunk:  # readany() returns b"" at end of stream
+                break
+            buf.extend(chunk)
+        for item in self.iter_ndjson_events(buf):
+            yield item
+
+    async def stream_response(
+        self,
+        response: aiohttp.ClientResponse,
+        head: bytes,
+        __event_emitter__: Callable[[dict], Awaitable[None]],
+        keep_output: bool = False,
+    ) -> tuple[Optional[str], Optional[str]]:
+        """Stream NDJSON content into the chat while the workflow is responding.
+
+        The first chunk is emitted as soon as it arrives. Later chunks are
+        coalesced and emitted once 512 bytes have built up or 50ms have passed
+        since the oldest pending chunk, whether or not more data arrives.
+
+        Returns: (executionId, output) - executionId is None unless an event
+        carried one, output is the streamed content if keep_output is set
+        """
+        _mono = time.monotonic
+        execution_id = None
+        pending = bytearray()
+        pending_since = 0.0
+        emitted = False
+        output = [] if keep_output else None
+
+        async def flush():
+            content = pending.decode("utf-8", "replace")
+            pending.clear()
+            if output is not None:
+                output.append(content)
+            await self.emit_message(__event_emitter__, content)
+
+        def flush_in() -> Optional[float]:
+            # Only bound the wait for data while something is waiting to go out
+            if not pending:
+                return None
+            return max(0.0, pending_since + _COALESCE_SECONDS - _mono())
+
+        async for event_type, event in self._iter_ndjson(response, head, flush_in):
+            if event is not None:
+                # Check for executionId in any event
+                if event.get("executionId"):
+                    execution_id = event.get("executionId")
+
+                content = event_content(event_type, event)
+                if content:
+                    if not pending:
+                        pending_since = _mono()
+                    pending.extend(
+                        content.encode() if isinstance(content, str) else content
+                    )
+
+            if pending and (
+                not emitted
+                or event is None  # Window ran out while waiting for data
+                or len(pending) >= _COALESCE_BYTES
+                or _mono() - pending_since >= _COALESCE_SECONDS
+            ):
+                await flush()
+                emitted = True
+
+        if pending:
+            await flush()
+        return execution_id, "".join(output) if output is not None else None
+
+    async def apply_status(
+        self,
+        status: dict,
+        last_message: str,
+        __event_emitter__: Callable[[dict], Awaitable[None]],
+    ) -> tuple[str, Optional[str]]:
+        """Stream a status update into the chat.
+
+        Returns: (last_message, output) - last_message is updated when the status
+        carried a new message, output stays None until the workflow completes and
+        then holds the final response that was streamed ("" if it had no result)
+        """
+        # Get current status message
+        current_message = status.get("message", "")
+        phase = status.get("phase", "unknown")
+        progress = status.get("progress", 0)
+
+        # Stream status update if message changed
+        if current_message and current_message != last_message:
+            last_message = current_message
+            self.streamed_messages.append(current_message)
+
+            # Format the status message for streaming
+            # The message from n8n already has emojis and formatting
+            # Also emit status indicator for the UI bar
+            formatted_message = current_message.replace("\\n", "\n")
+            await self.emit_combined(
+                __event_emitter__,
+                f"{formatted_message}\n\n---\n\n",
+                "info",
+                f"Phase: {phase} | Progress: {progress}%",
+                status.get("done", False)
+            )
+
+        # Check if workflow completed
+        if status.get("done"):
+            result = status.get("result")
+            if result:
+                final_response = self.format_final_response(result)
+                await self.emit_message(
+                    __event_emitter__,
+                    f"\n{final_response}"
+                )
+                return last_message, final_response
+            return last_message, ""
+
+        return last_message, None
+
+    async def stream_status(
+        self,
+        session: aiohttp.ClientSession,
+        execution_id: str,
+        headers: Mapping[str, str],
+    ) -> AsyncIterator[dict]:
+        """Yield status updates pushed by the stream endpoint as NDJSON.
+
+        Yields nothing if the endpoint is unavailable (e.g. 404), leaving the
+        caller to fall back to polling.
+        """
+        async with session.get(
+            self.valves.n8n_stream_url,
+            params={"executionId": execution_id},
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(
+                total=None, sock_read=self.valves.max_poll_time
+            ),
+        ) as response:
+            if response.status != 200:
+                return
+            # Read through _iter_ndjson, as a status carrying a large result
+            # can exceed the 512 KiB line limit of response.content.readline().
+            # Non-JSON lines come out as item events without a message, which
+            # apply_status ignores
+            async for _, status in self._iter_ndjson(response):
+                yield status
 
     async def poll_for_status(
         self,
         session: aiohttp.ClientSession,
         execution_id: str,
-        headers: dict,
+        headers: Mapping[str, str],
         __event_emitter__: Callable[[dict], Awaitable[None]],
-    ) -> str:
+    ) -> Optional[str]:
         """Poll the status endpoint until workflow completes or times out.
 
         Uses message streaming to show live status updates in the chat.
+        If ``n8n_stream_url`` is set, status updates are first read from that
+        push stream; polling takes over if it is unavailable or ends early.
+        The delay between polls backs off while the status is unchanged and
+        resets to ``poll_interval`` as soon as a new status message arrives,
+        measured from the start of each poll.
+
+        Returns: the final response once the workflow completed ("" if it had
+        no result), which has already been streamed into the chat, or None if
+        it failed, was not found or timed out
         """
-        start_time = time.time()
+        _mono = time.monotonic
+        poll_interval = self.valves.poll_interval
+        max_poll_time = self.valves.max_poll_time
+        max_delay = max(_MAX_POLL_DELAY, poll_interval)
+        start_time = _mono()
         last_message = ""
         poll_count = 0
+        delay = poll_interval
+        status_url = self.valves.n8n_status_url
+        params = {"executionId": execution_id}
+        session_get = session.get
+        poll_timeout = self._poll_timeout
+        sleep = asyncio.sleep
         self.streamed_messages = []  # Reset for this execution
 
         # Stream initial status into chat
@@ -195,22 +605,52 @@ class Pipe:
             f"🚀 **TOGAF Workflow Started**\n\n_Execution ID: {execution_id[:20]}..._\n\n---\n\n"
         )
 
+        if self.valves.n8n_stream_url:
+            statuses = self.stream_status(session, execution_id, headers)
+            try:
+                while True:
+                    # A stream that keeps sending updates must still stop at
+                    # max_poll_time like polling does
+                    status = await asyncio.wait_for(
+                        statuses.__anext__(),
+                        max(0.0, max_poll_time - (_mono() - start_time)),
+                    )
+                    # Errors are reported by the polling loop below
+                    if status.get("error"):
+                        break
+                    last_message, output = await self.apply_status(
+                        status, last_message, __event_emitter__
+                    )
+                    if output is not None:
+                        return output  # Already streamed into the chat
+            except StopAsyncIteration:
+                # Stream ended early, continue by polling
+                pass
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                # Stream dropped or ran out of time; the polling loop below
+                # picks it up or reports the timeout
+                pass
+            finally:
+                await statuses.aclose()
+
         while True:
-            elapsed = time.time() - start_time
-            if elapsed > self.valves.max_poll_time:
+            elapsed = _mono() - start_time
+            if elapsed > max_poll_time:
                 await self.emit_message(
                     __event_emitter__,
                     f"\n\n⏱️ **Workflow timed out** after {int(elapsed)}s. It may still be running in the background.\n"
                 )
-                return ""  # Return empty since we already streamed the message
+                return None  # Timeout message already streamed
 
             poll_count += 1
+            poll_started = _mono()
 
             try:
-                status_url = f"{self.valves.n8n_status_url}?executionId={execution_id}"
-                async with session.get(status_url, headers=headers) as status_response:
+                async with session_get(
+                    status_url, params=params, headers=headers, timeout=poll_timeout
+                ) as status_response:
                     if status_response.status == 200:
-                        status = await status_response.json()
+                        status = await status_response.json(loads=_loads)
 
                         # Check for error (execution not found means it was cleaned up or never existed)
                         if status.get("error"):
@@ -219,57 +659,28 @@ class Pipe:
                                 # Execution was cleaned up or doesn't exist yet
                                 # Keep polling for a bit in case it's just not created yet
                                 if poll_count < 3:
-                                    await asyncio.sleep(self.valves.poll_interval)
+                                    await sleep(poll_interval)
                                     continue
                                 await self.emit_message(
                                     __event_emitter__,
                                     f"\n\n⚠️ **Workflow execution not found.** It may have completed or expired.\n"
                                 )
-                                return ""
+                                return None
                             await self.emit_message(
                                 __event_emitter__,
                                 f"\n\n❌ **Workflow error:** {error_msg}\n"
                             )
-                            return ""
-
-                        # Get current status message
-                        current_message = status.get("message", "")
-                        phase = status.get("phase", "unknown")
-                        progress = status.get("progress", 0)
-
-                        # Stream status update if message changed
-                        if current_message and current_message != last_message:
+                            return None
+
+                        current_message, output = await self.apply_status(
+                            status, last_message, __event_emitter__
+                        )
+                        if output is not None:
+                            return output  # Already streamed into the chat
+                        if current_message != last_message:
+                            # Progress seen, poll faster again
                             last_message = current_message
-                            self.streamed_messages.append(current_message)
-
-                            # Format the status message for streaming
-                            # The message from n8n already has emojis and formatting
-                            formatted_message = current_message.replace("\\n", "\n")
-                            await self.emit_message(
-                                __event_emitter__,
-                                f"{formatted_message}\n\n---\n\n"
-                            )
-
-                            # Also emit status indicator for the UI bar
-                            await self.emit_status(
-                                __event_emitter__,
-                                "info",
-                                f"Phase: {phase} | Progress: {progress}%",
-                                status.get("done", False)
-                            )
-
-                        # Check if workflow completed
-                        if status.get("done"):
-                            result = status.get("result")
-                            if result:
-                                final_response = self.format_final_response(result)
-                                await self.emit_message(
-                                    __event_emitter__,
-                                    f"\n{final_response}"
-                                )
-                                return ""  # Return empty since we streamed the response
-                            # Return the last message as the result (already streamed)
-                            return ""
+                            delay = poll_interval
 
                     else:
                         # Status endpoint returned non-200, log but continue
@@ -282,44 +693,24 @@ class Pipe:
                     f"\n⚠️ _Network issue, retrying... ({poll_count})_\n"
                 )
 
-            await asyncio.sleep(self.valves.poll_interval)
+            # The interval runs from the start of the poll, so time spent waiting
+            # on the status endpoint counts towards it instead of adding to it.
+            # Jitter desynchronizes polls from concurrent chats
+            wait = delay + random.uniform(0, delay * 0.1)
+            await sleep(max(0.0, wait - (_mono() - poll_started)))
+            delay = min(delay * _POLL_BACKOFF, max_delay)
 
     def format_final_response(self, result: dict) -> str:
         """Format the final result as human-readable message."""
         if isinstance(result, str):
             return result
 
-        project = result.get("projectName", "Unknown")
-        repo = result.get("repositoryName", "unknown")
-        artifacts = result.get("artifacts", [])
-        domain = result.get("domain", "Technology")
-
-        return f"""**TOGAF Enterprise Architecture Complete**
-
-**Repository:** `{repo}`
-**Project:** {project}
-**Domain:** {domain}
-
-**Generated Artifacts ({len(artifacts)} files):**
-
-**ArchiMate 3.1 Models:**
-- docs/architecture/compliance.archimate
-- docs/architecture/business-canvas.archimate
-- docs/architecture/business-architecture.archimate
-- docs/architecture/technology-recommendations.archimate
-- docs/architecture/application-architecture.archimate
-- docs/architecture/infrastructure-architecture.archimate
-- docs/architecture/implementation-plan.archimate
-
-**Documentation:**
-- docs/requirements.md
-- docs/PRD.md
-
-**Deployment:**
-- docs/deployment/application.oam.yaml
-
-[View Repository](https://github.com/shlapolosa/{repo})
-"""
+        return render_final_response(
+            str(result.get("repositoryName", "unknown")),
+            str(result.get("projectName", "Unknown")),
+            str(result.get("domain", "Technology")),
+            len(result.get("artifacts", [])),
+        )
 
     async def pipe(
         self,
@@ -345,52 +736,112 @@ class Pipe:
             return "No messages found in the request body"
 
         question = messages[-1]["content"]
-        headers = {
-            "Authorization": f"Bearer {self.valves.n8n_bearer_token}",
-            "Content-Type": "application/json",
+
+        # Replay a cached result for a repeated question in the same chat.
+        # Without a chat id the entry could be served to other users
+        cache_key = None
+        if self.valves.enable_response_cache and chat_id:
+            cache_key = (
+                str(chat_id),
+                hashlib.blake2b(str(question).encode(), digest_size=16).hexdigest(),
+            )
+            cached = self._cached_response(cache_key)
+            if cached is not None:
+                # Deliver it the way the original run did: streamed or polled
+                # output is emitted, an immediate response is returned
+                cached_response, streamed = cached
+                if streamed:
+                    await self.emit_message(__event_emitter__, cached_response)
+                else:
+                    body["messages"].append(
+                        {"role": "assistant", "content": cached_response}
+                    )
+                await self.emit_status(__event_emitter__, "info", "Complete (cached)", True)
+                return "" if streamed else cached_response
+
+        # Workflow output already streamed into the chat, kept for the cache.
+        # Progress updates, banners and warnings are not part of it
+        streamed_output = None
+
+        headers = self._get_headers()
+        payload = {
+            "sessionId": chat_id if isinstance(chat_id, str) else f"{chat_id}",
+            self.valves.input_field: question,
         }
-        payload = {"sessionId": f"{chat_id}"}
-        payload[self.valves.input_field] = question
 
         try:
-            async with aiohttp.ClientSession() as session:
-                # Step 1: Start the workflow
-                await self.emit_status(
-                    __event_emitter__, "info", "Sending request to n8n...", False
-                )
+            session = await self._get_session()
 
-                async with session.post(
-                    self.valves.n8n_url, json=payload, headers=headers
-                ) as response:
-                    # Accept both 200 (OK) and 202 (Accepted) as valid responses
-                    # 202 is used for async workflows that return immediately with executionId
-                    if response.status not in (200, 202):
-                        error_text = await response.text()
-                        raise Exception(f"HTTP {response.status}: {error_text}")
-
-                    response_text = await response.text()
-                    n8n_response, execution_id = self.parse_response_text(response_text)
-
-                # Step 2: If we have an execution ID and status URL, poll for updates
-                if execution_id and self.valves.n8n_status_url:
-                    await self.emit_status(
+            # Step 1: Start the workflow
+            await self.emit_status(
+                __event_emitter__, "info", "Sending request to n8n...", False
+            )
+
+            async with session.post(
+                self.valves.n8n_url,
+                json=payload,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=self.valves.max_poll_time + 30),
+            ) as response:
+                # Accept both 200 (OK) and 202 (Accepted) as valid responses
+                # 202 is used for async workflows that return immediately with executionId
+                if response.status not in (200, 202):
+                    error_text = await response.text()
+                    raise Exception(f"HTTP {response.status}: {error_text}")
+
+                # Streaming NDJSON is emitted line by line as it arrives,
+                # anything else is buffered and parsed as a whole. The format
+                # is told from the first bytes, since a single-line JSON body
+                # can be far larger than what readline() accepts
+                head = b""
+                while len(head) < _NDJSON_HEAD_BYTES and b"\n" not in head.lstrip():
+                    chunk = await response.content.readany()
+                    if not chunk:
+                        break
+                    head += chunk
+                if _NDJSON_FIRST_EVENT.match(head):
+                    # Without an emitter nothing reaches the chat, so the
+                    # content is collected and returned instead
+                    execution_id, streamed_output = await self.stream_response(
+                        response,
+                        head,
                         __event_emitter__,
-                        "info",
-                        "Workflow accepted, polling for status...",
-                        False
-                    )
-                    # poll_for_status now streams messages directly to chat
-                    # Returns empty string since all content is streamed
-                    n8n_response = await self.poll_for_status(
-                        session, execution_id, headers, __event_emitter__
+                        cache_key is not None or not __event_emitter__,
                     )
+                    if __event_emitter__:
+                        n8n_response = ""  # Already streamed into the chat
+                    else:
+                        n8n_response, streamed_output = streamed_output, None
                 else:
-                    # No polling - return immediate response (non-async workflow)
-                    pass
+                    raw = head + await response.read()
+                    n8n_response, execution_id = self.parse_response_text(raw)
+
+            # Step 2: If we have an execution ID and status URL, poll for updates
+            if execution_id and self.valves.n8n_status_url:
+                await self.emit_status(
+                    __event_emitter__,
+                    "info",
+                    "Workflow accepted, polling for status...",
+                    False
+                )
+                # poll_for_status now streams messages directly to chat
+                # Returns the streamed final response, None on failure
+                polled_output = await self.poll_for_status(
+                    session, execution_id, headers, __event_emitter__
+                )
+                n8n_response = ""  # Already streamed into the chat
+                streamed_output = (
+                    None
+                    if polled_output is None
+                    else (streamed_output or "") + polled_output
+                )
+            else:
+                # No polling - return immediate response (non-async workflow)
+                pass
 
-                # Only append to messages if we have a response (non-streaming case)
-                if n8n_response:
-                    body["messages"].append({"role": "assistant", "content": n8n_response})
+            # Only append to messages if we have a response (non-streaming case)
+            if n8n_response:
+                body["messages"].append({"role": "assistant", "content": n8n_response})
 
         except Exception as e:
             error_msg = str(e)
@@ -407,5 +858,11 @@ class Pipe:
             )
             return ""  # Return empty since we streamed the error
 
+        if cache_key is not None:
+            if n8n_response:
+                self._store_response(cache_key, n8n_response, False)
+            elif streamed_output:
+                self._store_response(cache_key, streamed_output, True)
+
         await self.emit_status(__event_emitter__, "info", "Complete", True)
         return n8n_response if n8n_response else ""